@@ -5,21 +5,140 @@ Optimized Hybrid Architecture with Custom UI & Random Loading GIFs.
 
 import gradio as gr
 import asyncio
+import atexit
+import logging
 import os
+import queue
 import pandas as pd
 import altair as alt
-import json
+import orjson
 import random
+import re
+import uuid
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from dotenv import load_dotenv
 from google.genai import types
+from google.adk.sessions import Session
+from google.adk.sessions.base_session_service import GetSessionConfig
 
 # 🚀 นำเข้าเครื่องมือที่เร็วกว่า (ไม่ใช้ root_runner แล้ว)
 from bi_agent.tools import execute_sql_and_format, get_database_schema
-from bi_agent.agent import text_to_sql_runner, analysis_runner
+from bi_agent.sql_executor import strip_code_fences
+from bi_agent.agent import SQL_PROMPT_TEMPLATE, text_to_sql_runner, analysis_runner
+from bi_agent.cache import QuestionCache
 
 # Load environment variables from bi_agent/.env
 load_dotenv(dotenv_path='bi_agent/.env')
 
+# Logging: the event loop only enqueues records; a listener thread does the
+# (blocking) stream I/O, so log bursts never stall concurrent requests.
+_log_queue = queue.Queue(-1)
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream)
+# The queue side only merges the message args; the listener's handler applies
+# the real format (a full format here would be applied twice)
+_log_enqueue = QueueHandler(_log_queue)
+_log_enqueue.setFormatter(logging.Formatter("%(message)s"))
+logging.getLogger().addHandler(_log_enqueue)
+logging.getLogger().setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger(__name__)
+
+# Repeated questions are answered from memory (no LLM or DB work) until the
+# entry is RESULT_CACHE_TTL_SECONDS old, so answers follow changes in the data
+RESULT_CACHE_TTL_SECONDS = 900
+result_cache = QuestionCache(max_entries=128, ttl_seconds=RESULT_CACHE_TTL_SECONDS)
+
+# One ADK session per (app, visitor), created on first use and reused afterwards.
+# Visitors are keyed by their Gradio session hash, so concurrent users never
+# share a session. Agents use include_contents='none', so history is never sent
+# to the model; the session is recycled after SESSION_MAX_TURNS so stored events
+# stay bounded, and dropped when the visitor leaves.
+SESSION_MAX_TURNS = 50
+_session_cache: dict[tuple[str, str], Session] = {}
+_session_turns: dict[tuple[str, str], int] = {}
+# Runs on one session are serialized: the DB-backed store rejects appends from
+# a stale copy, and a recycle must never delete a session a run is still using
+_session_locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+# ============================================================================
+# 📊 Vega-Lite Chart Specs (JSON only, never executed)
+# ============================================================================
+# Equivalent of Altair's .interactive(): pan/zoom bound to the scales
+INTERACTIVE_PARAM = {"name": "grid", "select": "interval", "bind": "scales"}
+
+# Top-level composition key -> Altair class that can load that spec
+_COMPOSITE_CHARTS = {
+    'layer': alt.LayerChart,
+    'hconcat': alt.HConcatChart,
+    'vconcat': alt.VConcatChart,
+    'concat': alt.ConcatChart,
+    'facet': alt.FacetChart,
+    'repeat': alt.RepeatChart,
+}
+
+
+# Keys that would make the browser fetch or load external content
+_FORBIDDEN_SPEC_KEYS = {'url', 'href'}
+MAX_SPEC_DEPTH = 20
+
+
+def validate_chart_spec(spec) -> dict:
+    """
+    Reject a chart spec before Altair walks it.
+
+    The spec must be a JSON object, nested at most MAX_SPEC_DEPTH levels, with
+    no keys that load external resources (data urls, links, images). Rows are
+    always injected by the app, so a spec never needs any of these.
+
+    Raises:
+        ValueError: If the spec is not an acceptable Vega-Lite object
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"Chart spec must be a JSON object, got {type(spec).__name__}")
+
+    stack = [(spec, 1)]
+    while stack:
+        node, depth = stack.pop()
+        if depth > MAX_SPEC_DEPTH:
+            raise ValueError("Chart spec is nested too deeply")
+        if isinstance(node, dict):
+            forbidden = _FORBIDDEN_SPEC_KEYS.intersection(node)
+            if forbidden:
+                raise ValueError(f"Chart spec uses forbidden key(s): {', '.join(sorted(forbidden))}")
+            stack.extend((value, depth + 1) for value in node.values())
+        elif isinstance(node, list):
+            stack.extend((value, depth + 1) for value in node)
+    return spec
+
+
+def build_chart(chart_spec, records: list):
+    """Build an Altair chart from a Vega-Lite spec (dict or JSON string) and row records."""
+    if isinstance(chart_spec, str):
+        chart_spec = orjson.loads(strip_code_fences(chart_spec))
+
+    spec = dict(validate_chart_spec(chart_spec))
+    spec['data'] = {'values': records}
+
+    for key, chart_cls in _COMPOSITE_CHARTS.items():
+        if key in spec:
+            return chart_cls.from_dict(spec)
+    return alt.Chart.from_dict(spec)
+
+
+def records_to_dataframe(query_results: dict) -> pd.DataFrame:
+    """Build a DataFrame from the tool's records, using its known column order."""
+    columns = query_results.get('columns')
+    if columns:
+        # Duplicate column names collapse to one key in the JSON records
+        columns = list(dict.fromkeys(columns))
+    return pd.DataFrame.from_records(query_results['data'], columns=columns or None)
+
+
 # ============================================================================
 # 🏎️ Heuristic Fast Track Logic (ทางด่วนวาดกราฟด้วย Python)
 # ============================================================================
@@ -39,13 +158,16 @@ def get_heuristic_analysis(df: pd.DataFrame):
             dim = cols[1] if is_num_0 else cols[0]
             val = cols[0] if is_num_0 else cols[1]
             
-            chart_spec = f"""
-chart = alt.Chart(df).mark_bar().encode(
-    x=alt.X('{val}:Q'),
-    y=alt.Y('{dim}:N', sort='-x', title=None),
-    tooltip=['{dim}', '{val}']
-).properties(title='{val} by {dim}').interactive()
-"""
+            chart_spec = {
+                "title": f"{val} by {dim}",
+                "mark": "bar",
+                "encoding": {
+                    "x": {"field": val, "type": "quantitative"},
+                    "y": {"field": dim, "type": "nominal", "sort": "-x", "title": None},
+                    "tooltip": [{"field": dim, "type": "nominal"}, {"field": val, "type": "quantitative"}]
+                },
+                "params": [INTERACTIVE_PARAM]
+            }
             top_row = df.sort_values(by=val, ascending=False).iloc[0]
             val_formatted = f"{top_row[val]:,.2f}" if isinstance(top_row[val], float) else f"{top_row[val]}"
             explanation = f"The highest `{dim}` is **{top_row[dim]}** with a total `{val}` of {val_formatted}."
@@ -54,171 +176,363 @@ chart = alt.Chart(df).mark_bar().encode(
 
     if len(df) == 1 and len(cols) > 1:
         if all(pd.to_numeric(df[c], errors='coerce').notna().all() for c in cols):
-            chart_spec = """
-df_melted = df.melt(var_name='Metric', value_name='Value')
-base = alt.Chart(df_melted).encode(x='Value:Q', y=alt.Y('Metric:N', title=None, sort='-x'))
-bars = base.mark_bar()
-text = base.mark_text(align='left', dx=5).encode(text='Value:Q')
-chart = (bars + text).properties(title='Key Metrics Overview').interactive()
-"""
+            chart_spec = {
+                "title": "Key Metrics Overview",
+                "transform": [{"fold": list(cols), "as": ["Metric", "Value"]}],
+                "encoding": {
+                    "x": {"field": "Value", "type": "quantitative"},
+                    "y": {"field": "Metric", "type": "nominal", "title": None, "sort": "-x"}
+                },
+                "layer": [
+                    {"mark": "bar", "params": [INTERACTIVE_PARAM]},
+                    {"mark": {"type": "text", "align": "left", "dx": 5},
+                     "encoding": {"text": {"field": "Value", "type": "quantitative"}}}
+                ]
+            }
             explanation = "⚡️ **Fast Analysis:** The chart displays the key metrics from your query for direct comparison."
             return chart_spec, explanation
             
     return None, None
 
 
+TIME_COLUMN_HINTS = ('date', 'year', 'month', 'quarter', 'week', 'day', 'period')
+
+
+def _is_time_column(df: pd.DataFrame, col) -> bool:
+    if pd.api.types.is_datetime64_any_dtype(df[col]):
+        return True
+    name = str(col).lower()
+    # Whole words ("Order_Date", "Year") or a suffix ("OrderDate"), but not "Days_Overdue"
+    return name.endswith(TIME_COLUMN_HINTS) or any(w in TIME_COLUMN_HINTS for w in re.split(r'[^a-z]+', name))
+
+
+def get_chart_hint(df: pd.DataFrame):
+    """Classify the analysis agent's visualization case (1-4) in Python, so the LLM doesn't have to."""
+    if df.empty:
+        return None
+
+    cols = list(df.columns)
+    time_cols = [c for c in cols if _is_time_column(df, c)]
+    numeric_cols = [
+        c for c in cols
+        if c not in time_cols and pd.to_numeric(df[c], errors='coerce').notna().all()
+    ]
+
+    if not numeric_cols:
+        return "Case 1 (Text-Only List): no numeric columns, use a text mark."
+    if len(df) == 1 and len(numeric_cols) > 1:
+        return f"Case 2 (Single Row / KPI): fold {numeric_cols} into Metric/Value, horizontal bars + text labels."
+    if time_cols:
+        return f"Case 3 (Time Series): line chart with `{time_cols[0]}` on x and {numeric_cols} as values."
+    categories = [c for c in cols if c not in numeric_cols]
+    return f"Case 4 (Categorical Comparison): horizontal bar chart, y = {categories}, x = {numeric_cols}."
+
+
 # ============================================================================
 # 🧠 Pipeline Logic (Hybrid)
 # ============================================================================
-async def run_bi_pipeline_async(user_question: str):
+async def _get_session(runner, app_name: str, user_id: str) -> Session:
+    # Callers hold the session lock (see _session_scope), so no run is active here
+    key = (app_name, user_id)
+    service = runner.session_service
+    session = _session_cache.get(key)
+
+    if session is not None and _session_turns[key] >= SESSION_MAX_TURNS:
+        await service.delete_session(app_name=app_name, user_id=user_id, session_id=session.id)
+        session = None
+
+    if session is None:
+        # Deterministic id: other workers (or this one after a restart) reuse the same stored session
+        session_id = f"{app_name}-{user_id}"
+        session = await service.get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id,
+            config=GetSessionConfig(num_recent_events=1)
+        )
+        if session is None:
+            session = await service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        _session_cache[key] = session
+        _session_turns[key] = 0
+
+    _session_turns[key] += 1
+    return session
+
+
+@asynccontextmanager
+async def _session_scope(runner, app_name: str, user_id: str):
+    """Yield the user's session for one agent run; runs on the same session wait their turn."""
+    key = (app_name, user_id)
+    lock = _session_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        yield await _get_session(runner, app_name, user_id)
+
+
+async def _release_sessions(user_id: str):
+    """Delete a visitor's (or batch worker's) sessions once it is done."""
+    for runner, app_name in ((text_to_sql_runner, 'text_to_sql'), (analysis_runner, 'analysis')):
+        key = (app_name, user_id)
+        lock = _session_locks.get(key)
+        if lock is None:
+            continue
+        # Wait for a run still in flight to finish before deleting its session
+        async with lock:
+            session = _session_cache.pop(key, None)
+            _session_turns.pop(key, None)
+            if session is not None:
+                await runner.session_service.delete_session(app_name=app_name, user_id=user_id, session_id=session.id)
+        _session_locks.pop(key, None)
+
+
+def _visitor_id(request: gr.Request | None) -> str:
+    """Stable per-browser-session user id (random if Gradio gives no request)."""
+    if request is not None and request.session_hash:
+        return f"web-{request.session_hash}"
+    return f"web-{uuid.uuid4().hex}"
+
+
+def _cache_results(user_question: str, results: dict):
+    # Only called once the analysis step succeeded; also require that the SQL executed
+    try:
+        if orjson.loads(results.get('query_results', '{}')).get('success'):
+            result_cache.put(user_question, results)
+    except Exception as e:
+        logger.debug("Result cache skipped: %s", e)
+
+
+async def run_bi_pipeline_async(user_question: str, user_id: str):
+    """Run the hybrid pipeline, yielding the partially-filled results after each stage."""
+    cached_results = result_cache.get(user_question)
+    if cached_results is not None:
+        logger.info("♻️ CACHE HIT: Reusing previous answer (Skipping AI & DB!)")
+        yield cached_results
+        return
+
     results = {}
+    chart_hint = None
+    analysis_ok = False
     
     # --- STEP 1: Text-to-SQL (AI) ---
-    print("🤖 1. Generating SQL...")
-    session_sql = await text_to_sql_runner.session_service.create_session(user_id='user', app_name='text_to_sql')
-    
-    schema_context = get_database_schema()
-    enhanced_prompt = f"Here is the Database Schema you must use:\n{schema_context}\n\nUser Question: {user_question}"
+    logger.info("🤖 1. Generating SQL...")
+    # DB calls are blocking (pyodbc); keep them off the event loop shared by all Gradio users
+    schema_context = await asyncio.to_thread(get_database_schema)
+    enhanced_prompt = SQL_PROMPT_TEMPLATE.format(schema=schema_context, question=user_question)
     content_sql = types.Content(role='user', parts=[types.Part(text=enhanced_prompt)])
     
-    events_sql = text_to_sql_runner.run_async(user_id='user', session_id=session_sql.id, new_message=content_sql)
-    
     sql_query = ""
-    async for event in events_sql:
-        if event.actions and event.actions.state_delta:
-            if 'sql_query' in event.actions.state_delta:
-                sql_query = event.actions.state_delta['sql_query']
+    async with _session_scope(text_to_sql_runner, 'text_to_sql', user_id) as session_sql:
+        events_sql = text_to_sql_runner.run_async(user_id=user_id, session_id=session_sql.id, new_message=content_sql)
+        async for event in events_sql:
+            if event.actions and event.actions.state_delta:
+                if 'sql_query' in event.actions.state_delta:
+                    sql_query = event.actions.state_delta['sql_query']
     results['sql_query'] = sql_query
 
+    if not sql_query:
+        results['query_results'] = orjson.dumps({'success': False, 'error': 'No SQL query was generated'}).decode()
+        yield dict(results)
+        return
+    yield dict(results)
+
     # --- STEP 2: Execute SQL (Python) ---
-    print("⚡️ 2. Executing SQL (Python)...")
-    if sql_query:
-        clean_sql = sql_query.replace("```sql", "").replace("```", "").strip()
-        query_results_json = execute_sql_and_format(clean_sql)
-        results['query_results'] = query_results_json
-    else:
-        return results
+    logger.info("⚡️ 2. Executing SQL (Python)...")
+    clean_sql = strip_code_fences(sql_query)
+    query_results_json = await asyncio.to_thread(execute_sql_and_format, clean_sql)
+    results['query_results'] = query_results_json
+    yield dict(results)
 
     # --- STEP 2.5: Heuristic Fast Track ---
     try:
-        data_dict = json.loads(query_results_json)
-        if data_dict.get('success') and data_dict.get('data'):
-            df_temp = pd.DataFrame(data_dict['data'])
-            fast_chart_spec, fast_explanation = get_heuristic_analysis(df_temp)
-            
-            if fast_chart_spec and fast_explanation:
-                print("🚀 FAST TRACK: Using Python to generate chart (Skipping AI!)")
-                results['chart_spec'] = fast_chart_spec
-                results['explanation_text'] = fast_explanation
-                return results 
+        data_dict = orjson.loads(query_results_json)
+        if not (data_dict.get('success') and data_dict.get('data')):
+            return
+
+        df_temp = records_to_dataframe(data_dict)
+        fast_chart_spec, fast_explanation = get_heuristic_analysis(df_temp)
+        
+        if fast_chart_spec and fast_explanation:
+            logger.info("🚀 FAST TRACK: Using Python to generate chart (Skipping AI!)")
+            results['chart_spec'] = fast_chart_spec
+            results['explanation_text'] = fast_explanation
+            _cache_results(user_question, results)
+            yield dict(results)
+            return
+
+        # Only the analysis agent reads the hint, so classify after the fast track
+        chart_hint = get_chart_hint(df_temp)
     except Exception as e:
-        print(f"Heuristic bypass failed: {e}")
+        logger.warning("Heuristic bypass failed: %s", e)
 
     # --- STEP 3: Unified Analysis (AI) ---
-    print("🎨 3. Complex Data. Analyzing with AI...")
-    session_viz = await analysis_runner.session_service.create_session(user_id='user', app_name='analysis')
-    
+    logger.info("🎨 3. Complex Data. Analyzing with AI...")
     viz_prompt = f"Analyze this data:\n{results['query_results']}"
+    if chart_hint:
+        viz_prompt += f"\n\nChart Hint: {chart_hint}"
     content_viz = types.Content(role='user', parts=[types.Part(text=viz_prompt)])
-    
-    events_viz = analysis_runner.run_async(user_id='user', session_id=session_viz.id, new_message=content_viz)
-    
-    async for event in events_viz:
-        if event.actions and event.actions.state_delta:
-            if 'analysis_result' in event.actions.state_delta:
-                raw_output = event.actions.state_delta['analysis_result']
-                try:
-                    clean_output = raw_output.replace("```json", "").replace("```", "").strip()
-                    start_index = clean_output.find('{')
-                    end_index = clean_output.rfind('}') + 1
-                    if start_index != -1 and end_index != -1:
-                        json_str = clean_output[start_index:end_index]
-                        analysis_data = json.loads(json_str)
-                        results['chart_spec'] = analysis_data.get('chart_spec', '')
-                        results['explanation_text'] = analysis_data.get('explanation', '')
-                    else:
-                        results['explanation_text'] = raw_output
-                except Exception as e:
-                    results['explanation_text'] = f"Error parsing insights. Raw: {raw_output[:100]}..."
 
-    return results
+    async with _session_scope(analysis_runner, 'analysis', user_id) as session_viz:
+        events_viz = analysis_runner.run_async(user_id=user_id, session_id=session_viz.id, new_message=content_viz)
+        async for event in events_viz:
+            if event.actions and event.actions.state_delta:
+                if 'analysis_result' in event.actions.state_delta:
+                    raw_output = event.actions.state_delta['analysis_result']
+                    analysis_ok = False
+                    try:
+                        clean_output = strip_code_fences(raw_output)
+                        start_index = clean_output.find('{')
+                        end_index = clean_output.rfind('}') + 1
+                        if start_index != -1 and end_index != -1:
+                            json_str = clean_output[start_index:end_index]
+                            analysis_data = orjson.loads(json_str)
+                            results['chart_spec'] = analysis_data.get('chart_spec', '')
+                            results['explanation_text'] = analysis_data.get('explanation', '')
+                            analysis_ok = bool(results['explanation_text'])
+                        else:
+                            results['explanation_text'] = raw_output
+                    except Exception as e:
+                        results['explanation_text'] = f"Error parsing insights. Raw: {raw_output[:100]}..."
+
+    # Always mark the analysis stage as finished, even if the agent returned nothing
+    results.setdefault('explanation_text', '')
+    # Unparseable or empty insights are shown once but never cached
+    if analysis_ok:
+        _cache_results(user_question, results)
+    yield dict(results)
 
 # ============================================================================
 # ⚙️ Data Processing & Gradio Wrapper
 # ============================================================================
-async def process_request_async(message: str):
+def format_outputs(results: dict):
+    """Turn (possibly partial) pipeline results into the four UI output values."""
+    sql_query = strip_code_fences(results.get('sql_query', ''))
+
+    # Stage 1 done: only the SQL is known so far
+    if 'query_results' not in results:
+        return sql_query, None, None, "*Running query...*"
+
+    query_results_str = results['query_results']
     try:
-        if not message.strip():
-            return "Error: Please enter a question", None, None, "Error: No question provided"
+        query_results = orjson.loads(query_results_str) if isinstance(query_results_str, (bytes, str)) else query_results_str
+    except:
+        query_results = {'success': False, 'data': [], 'error': 'Failed to parse query results'}
 
-        results = await run_bi_pipeline_async(message)
+    if not query_results.get('success', False):
+        error_msg = query_results.get('error', 'Unknown error')
+        sql_query = f"-- Error executing query\n{sql_query}\n\n-- Error: {error_msg}"
+        return sql_query, None, None, f"Error executing query: {error_msg}"
 
-        sql_query = results.get('sql_query', '')
-        sql_query = sql_query.strip()
-        if sql_query.startswith("```sql"):
-            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-        elif sql_query.startswith("```"):
-            sql_query = sql_query.replace("```", "").strip()
+    data_list = query_results.get('data', [])
+    if not data_list:
+        df = pd.DataFrame()
+        return sql_query, df, None, "The query executed successfully but returned no data."
 
-        query_results_str = results.get('query_results', '{}')
-        try:
-            query_results = json.loads(query_results_str) if isinstance(query_results_str, str) else query_results_str
-        except:
-            query_results = {'success': False, 'data': [], 'error': 'Failed to parse query results'}
+    df = records_to_dataframe(query_results)
 
-        if not query_results.get('success', False):
-            error_msg = query_results.get('error', 'Unknown error')
-            sql_query = f"-- Error executing query\n{sql_query}\n\n-- Error: {error_msg}"
-            return sql_query, None, None, f"Error executing query: {error_msg}"
+    # Stage 2 done: table is ready, chart and insight are still being produced
+    if 'explanation_text' not in results:
+        return sql_query, df, None, "*Generating insights...*"
 
-        data_list = query_results.get('data', [])
-        if not data_list:
-            df = pd.DataFrame()
-            return sql_query, df, None, "The query executed successfully but returned no data."
+    chart_spec = results.get('chart_spec', '')
+    explanation_text = results['explanation_text']
 
-        df = pd.DataFrame(data_list)
-        
-        chart_spec = results.get('chart_spec', '')
-        explanation_text = results.get('explanation_text', '')
-
-        chart = None
-        if chart_spec:
-            try:
-                chart_spec_clean = chart_spec.strip()
-                if chart_spec_clean.startswith("```python"):
-                    chart_spec_clean = chart_spec_clean.replace("```python", "").replace("```", "").strip()
-                elif chart_spec_clean.startswith("```"):
-                    chart_spec_clean = chart_spec_clean.replace("```", "").strip()
-
-                namespace = {'alt': alt, 'pd': pd, 'df': df, 'data': df.to_dict(orient='records')}
-                exec(chart_spec_clean, namespace)
-
-                if 'chart' in namespace:
-                    chart = namespace['chart']
-            except Exception as e:
-                print(f"Chart generation error: {str(e)}")
-                import traceback
-                traceback.print_exc()
-
-        return sql_query, df, chart, explanation_text
+    chart = None
+    if chart_spec:
+        try:
+            chart = build_chart(chart_spec, data_list)
+        except Exception as e:
+            logger.warning("Chart generation error: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
 
-    except Exception as e:
-        error_msg = f"Error: {str(e)}"
-        print(f"Full error: {e}")
-        import traceback
-        traceback.print_exc()
-        return error_msg, None, None, error_msg
+    return sql_query, df, chart, explanation_text
 
 
-def process_request(message: str):
+async def process_request_async(message: str, request: gr.Request = None):
+    """Gradio async generator: streams SQL, then table, then chart and insight."""
+    # First partial result also dismisses the full-screen loading overlay
+    hide_loading = gr.update(value="", visible=False)
     try:
-        sql_query, df, chart, explanation = asyncio.run(
-            process_request_async(message)
-        )
-        return sql_query, df, chart, explanation
+        if not message.strip():
+            yield "Error: Please enter a question", None, None, "Error: No question provided", hide_loading
+            return
+
+        async for results in run_bi_pipeline_async(message, user_id=_visitor_id(request)):
+            yield (*format_outputs(results), hide_loading)
+
     except Exception as e:
         error_msg = f"Error: {str(e)}"
-        return error_msg, None, None, error_msg
+        logger.exception("BI pipeline failed")
+        yield error_msg, None, None, error_msg, hide_loading
+
+
+# ============================================================================
+# 📦 Batch Mode (many questions, concurrent pipelines)
+# ============================================================================
+# Pipelines are I/O-bound on LLM + DB calls, so running several at once gives
+# near-linear throughput; the cap keeps us under the Gemini rate limit.
+BATCH_CONCURRENCY = 5
+
+
+async def collect_pipeline_results(user_question: str, user_id: str) -> dict:
+    """Run the pipeline to completion and return only the final results."""
+    results = {}
+    async for results in run_bi_pipeline_async(user_question, user_id=user_id):
+        pass
+    return results
+
+
+def load_batch_questions(file_path: str) -> list[str]:
+    if file_path.lower().endswith('.csv'):
+        df = pd.read_csv(file_path)
+        column = 'question' if 'question' in df.columns else df.columns[0]
+        questions = df[column].dropna().astype(str).tolist()
+    else:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            questions = f.read().splitlines()
+    return [q.strip() for q in questions if q.strip()]
+
+
+async def run_batch_async(questions: list[str]) -> list[dict]:
+    """Answer all questions with at most BATCH_CONCURRENCY pipelines in flight."""
+    all_results: list[dict] = [{} for _ in questions]
+    pending = iter(enumerate(questions))
+    # Per-run prefix: two uploads running at once never share worker sessions
+    run_id = uuid.uuid4().hex[:8]
+
+    async def worker(worker_id: int):
+        # Each worker has its own ADK session; a session can't take concurrent runs
+        user_id = f'batch-{run_id}-{worker_id}'
+        try:
+            for index, question in pending:
+                try:
+                    all_results[index] = await collect_pipeline_results(question, user_id=user_id)
+                except Exception as e:
+                    all_results[index] = {'error': str(e)}
+        finally:
+            await _release_sessions(user_id)
+
+    await asyncio.gather(*(worker(w) for w in range(min(BATCH_CONCURRENCY, len(questions)))))
+    return all_results
+
+
+async def process_batch_async(file_path: str):
+    if not file_path:
+        return pd.DataFrame(columns=["Question", "SQL", "Rows", "Insight"])
+
+    questions = load_batch_questions(file_path)
+    all_results = await run_batch_async(questions)
+
+    rows = []
+    for question, results in zip(questions, all_results):
+        sql_query = strip_code_fences(results.get('sql_query', ''))
+        try:
+            query_results = orjson.loads(results.get('query_results', '{}'))
+        except Exception:
+            query_results = {}
+
+        if results.get('error') or not query_results.get('success'):
+            error_msg = results.get('error') or query_results.get('error', 'Unknown error')
+            rows.append([question, sql_query, 0, f"Error: {error_msg}"])
+        else:
+            rows.append([question, sql_query, query_results.get('row_count', 0), results.get('explanation_text', '')])
+
+    return pd.DataFrame(rows, columns=["Question", "SQL", "Rows", "Insight"])
 
 # ============================================================================
 # 🎨 UI & Styling (จากโค้ดของเพื่อนคุณ)
@@ -419,65 +733,77 @@ with gr.Blocks(
         # The Business Wizard of Intelligent on the Land of OOO 
         """)
 
-    with gr.Row(9):
-        with gr.Column(scale=2):
-            with gr.Row(5):
-                user_input = gr.Textbox(
-                    label="Your Question",
-                    placeholder="e.g., 'What are the top 10 products by price?'",
-                    lines=3
-                )
-
-            # Examples
-            with gr.Row(5):
-                with gr.Column(elem_classes=["examples-container"]) as examples_container:
-                    gr.Examples(
-                        examples=[
-                            ["What are the top 10 products by transfer price?"],
-                            ["Show me the product categories and their average prices"],
-                            ["List all products in the Bikes category"],
-                            ["How many products are there in each category?"],
-                            ["What is the most expensive product?"],
-                            ["Compare the total Sales Amount and total Sales Amount Quota for each Product Category for the 'Actual' version."]
-                        ],
-                        inputs=user_input
-                    )
-
-            with gr.Row(2):
-                submit_btn = gr.Button("Analyze Data", variant="primary")
-                clear_btn = gr.Button("Clear")
-
-            with gr.Row(12):
-                with gr.Column():
-                    gr.Markdown("### Data Table")
-                    data_output = gr.DataFrame(
-                        wrap=True
-                    )            
-
-    # Four output panels (จัดสเกลตามเพื่อน)
+    with gr.Tabs():
+        with gr.Tab("Ask"):
+            with gr.Row(9):
+                with gr.Column(scale=2):
+                    with gr.Row(5):
+                        user_input = gr.Textbox(
+                            label="Your Question",
+                            placeholder="e.g., 'What are the top 10 products by price?'",
+                            lines=3
+                        )
+
+                    # Examples
+                    with gr.Row(5):
+                        with gr.Column(elem_classes=["examples-container"]) as examples_container:
+                            gr.Examples(
+                                examples=[
+                                    ["What are the top 10 products by transfer price?"],
+                                    ["Show me the product categories and their average prices"],
+                                    ["List all products in the Bikes category"],
+                                    ["How many products are there in each category?"],
+                                    ["What is the most expensive product?"],
+                                    ["Compare the total Sales Amount and total Sales Amount Quota for each Product Category for the 'Actual' version."]
+                                ],
+                                inputs=user_input
+                            )
+
+                    with gr.Row(2):
+                        submit_btn = gr.Button("Analyze Data", variant="primary")
+                        clear_btn = gr.Button("Clear")
+
+                    with gr.Row(12):
+                        with gr.Column():
+                            gr.Markdown("### Data Table")
+                            data_output = gr.DataFrame(
+                                wrap=True
+                            )            
+
+            # Four output panels (จัดสเกลตามเพื่อน)
     
-        with gr.Column(scale=3):
+                with gr.Column(scale=3):
             
-            with gr.Row(1):
-                with gr.Column():
-                    gr.Markdown("### Insights")
-                    explanation_output = gr.Markdown(
-                        value="*Waiting for input...*"
-                    )
+                    with gr.Row(1):
+                        with gr.Column():
+                            gr.Markdown("### Insights")
+                            explanation_output = gr.Markdown(
+                                value="*Waiting for input...*"
+                            )
             
-            with gr.Row(1):
-                with gr.Column():
-                    gr.Markdown("### Generated SQL")
-                    sql_output = gr.Code(
-                        label="SQL Query",
-                        language="sql",
-                        value="-- Waiting for input..."
-                    )
-
-            with gr.Row(4):
-                with gr.Column():
-                    gr.Markdown("### Visualization")
-                    chart_output = gr.Plot(label="Chart")
+                    with gr.Row(1):
+                        with gr.Column():
+                            gr.Markdown("### Generated SQL")
+                            sql_output = gr.Code(
+                                label="SQL Query",
+                                language="sql",
+                                value="-- Waiting for input..."
+                            )
+
+                    with gr.Row(4):
+                        with gr.Column():
+                            gr.Markdown("### Visualization")
+                            chart_output = gr.Plot(label="Chart")
+
+        with gr.Tab("Batch mode"):
+            gr.Markdown("Upload a `.txt` file (one question per line) or a `.csv` with a `question` column.")
+            with gr.Row():
+                batch_file = gr.File(label="Questions File", file_types=[".txt", ".csv"], type="filepath")
+                batch_btn = gr.Button("Run Batch", variant="primary")
+            batch_output = gr.DataFrame(
+                headers=["Question", "SQL", "Rows", "Insight"],
+                wrap=True
+            )
 
             
 
@@ -520,9 +846,9 @@ with gr.Blocks(
         queue=False
     )
     run_process = show_loading.then(
-        fn=process_request,
+        fn=process_request_async,
         inputs=[user_input],
-        outputs=[sql_output, data_output, chart_output, explanation_output]
+        outputs=[sql_output, data_output, chart_output, explanation_output, loading_screen]
     )
     run_process.then(
         fn=lambda: gr.update(value="", visible=False),
@@ -530,6 +856,12 @@ with gr.Blocks(
         queue=False
     )
 
+    batch_btn.click(
+        fn=process_batch_async,
+        inputs=[batch_file],
+        outputs=[batch_output]
+    )
+
     clear_btn.click(
         fn=lambda: (
             "",
@@ -552,6 +884,12 @@ with gr.Blocks(
         """
     )
 
+    # Drop the visitor's ADK sessions when the browser tab closes
+    async def release_visitor_sessions(request: gr.Request):
+        await _release_sessions(_visitor_id(request))
+
+    demo.unload(release_visitor_sessions)
+
 
 if __name__ == "__main__":
     demo.launch()
\ No newline at end of file
@@ -8,6 +8,8 @@ for the BI agent pipeline using Google ADK.
 from bi_agent.agent import (
     # Constants
     GEMINI_MODEL,
+    ANALYSIS_MODEL,
+    SQL_PROMPT_TEMPLATE,
     # Agents & Runners (เหลือแค่ 2 ตัวเทพ)
     text_to_sql_agent,
     text_to_sql_runner,
@@ -16,15 +18,19 @@ from bi_agent.agent import (
 )
 
 from bi_agent.bi_service import BIService
+from bi_agent.cache import QuestionCache
 from bi_agent.tools import DatabaseTools, execute_sql_and_format, get_database_schema
 
 __all__ = [
     'GEMINI_MODEL',
+    'ANALYSIS_MODEL',
+    'SQL_PROMPT_TEMPLATE',
     'text_to_sql_agent',
     'text_to_sql_runner',
     'analysis_agent',
     'analysis_runner',
     'BIService',
+    'QuestionCache',
     'DatabaseTools',
     'execute_sql_and_format',
     'get_database_schema',
@@ -1,13 +1,40 @@
+import os
+from dotenv import load_dotenv
 from google.adk.agents.llm_agent import LlmAgent
-from google.adk.agents.sequential_agent import SequentialAgent
-from google.adk.runners import InMemoryRunner
-from bi_agent.tools import get_database_schema
+from google.adk.runners import InMemoryRunner, Runner
+from google.adk.planners import BuiltInPlanner
+from google.adk.sessions import DatabaseSessionService
+from google.genai import types
+
+# Load environment variables (API key, optional model overrides)
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
 GEMINI_MODEL = "gemini-2.5-flash"
 
+# Text-to-SQL needs the full model; the analysis stage (chart spec + 2 sentences,
+# case pre-classified by the app) can be moved to a cheaper tier such as
+# "gemini-2.5-flash-lite" via GEMINI_ANALYSIS_MODEL once quality is verified.
+ANALYSIS_MODEL = os.getenv("GEMINI_ANALYSIS_MODEL", GEMINI_MODEL)
+
+# Optional persistent session store shared by all Gradio workers and restarts,
+# e.g. "sqlite+aiosqlite:///./bi_sessions.db". Unset = in-process sessions.
+SESSION_DB_URL = os.getenv("ADK_SESSION_DB_URL")
+session_service = DatabaseSessionService(db_url=SESSION_DB_URL) if SESSION_DB_URL else None
+
+
+def _create_runner(agent: LlmAgent, app_name: str):
+    """Create a runner on the shared persistent session store, or in memory if none is configured."""
+    if session_service is None:
+        return InMemoryRunner(agent=agent, app_name=app_name)
+    return Runner(agent=agent, app_name=app_name, session_service=session_service)
+
 # ============================================================================
 # Agent 1: Text-to-SQL (standalone)
 # ============================================================================
+# User message for the Text-to-SQL agent, shared by the app and the evaluation.
+# Static schema goes first and the user question last, so both build the exact
+# same prompt for the same question.
+SQL_PROMPT_TEMPLATE = "Here is the Database Schema you must use:\n{schema}\n\nUser Question: {question}"
 
 text_to_sql_agent = LlmAgent(
     model=GEMINI_MODEL,
@@ -18,7 +45,7 @@ text_to_sql_agent = LlmAgent(
 
 ## Context
 You are operating in a Business Intelligence environment with access to a Microsoft SQL Server database.
-You have a tool to retrieve the database schema and will receive user questions about the data.
+The database schema is provided at the start of each user message, followed by the user's question about the data.
 
 ## Objective
 Your primary goal is to generate accurate, efficient SQL SELECT queries that answer the user's natural language question.
@@ -46,7 +73,7 @@ Do NOT include:
 
 ## Specifications
 HARD CONSTRAINTS:
-1. DO NOT call 'get_database_schema'. The schema is provided in the user's input.
+1. Use ONLY the schema provided in the user's input. You have no tools; answer with SQL directly.
 2. Use ONLY SELECT statements (NEVER INSERT, UPDATE, DELETE, DROP, ALTER, TRUNCATE)
 3. Reference ONLY tables and columns present in the schema.
 4. **CRITICAL RULE:** If the user asks for a column (like 'Category', 'Country', 'Region') that does NOT exist in the requested table, YOU MUST LOOK FOR FOREIGN KEYS (columns ending in 'Key' or 'ID') and JOIN the relevant tables. NEVER INVENT COLUMN NAMES.
@@ -116,88 +143,75 @@ SQL QUERY CONSTRUCTION RULES:
   </example>  
 </examples>
     """,
-    tools=[get_database_schema],
+    # No tools: the schema is injected by the caller, so SQL comes back in a single model turn.
+    # Sessions are reused across questions; each call only needs the current turn
+    include_contents='none',
     output_key="sql_query"
 )
 
 # Runner for text-to-SQL agent
-text_to_sql_runner = InMemoryRunner(agent=text_to_sql_agent, app_name='text_to_sql')
+text_to_sql_runner = _create_runner(text_to_sql_agent, 'text_to_sql')
 
 
 # ============================================================================
-# Sequential Agent: Visualization + Explanation
+# Agent 2: Unified Analysis (Visualization + Explanation in one call)
 # ============================================================================
 
 analysis_agent = LlmAgent(
-    model=GEMINI_MODEL,
+    model=ANALYSIS_MODEL,
     name='analysis_agent',
-    description="Generates visualization code AND explanation from query results.",
+    description="Generates a Vega-Lite chart spec AND explanation from query results.",
     instruction="""
 <system_prompt>
-You are a Senior Data Analyst. Your task is to analyze the provided data and output JSON containing TWO things:
-1. 'chart_spec': Python Altair code to visualize the data.
+You are a Senior Data Analyst. Analyze the provided data and output JSON containing TWO things:
+1. 'chart_spec': A compact Vega-Lite (v5) JSON object to visualize the data.
 2. 'explanation': A concise 2-sentence business insight.
 
-## CRITICAL VISUALIZATION RULE (OVERRIDE ALL OTHERS)
-**IF the category names are text (e.g. Products, Cities), YOU MUST USE A HORIZONTAL BAR CHART.**
-- Code: `alt.Chart(df).mark_bar().encode(x='Value:Q', y=alt.Y('Category:N', sort='-x'))`
-- NEVER use Vertical Bars for text labels. Vertical is ONLY for Time/Dates.
-
-##CRITICAL RULES FOR "chart_spec":
-- DO NOT hardcode the raw data inside the Python code. 
-- The dataframe is ALREADY loaded in the environment as a variable named `df`.
-- DO NOT import pandas or altair. They are already imported as `pd` and `alt`.
-- Simply write the Altair code using `df` and assign the final chart to a variable exactly named `chart`.
-- Use `alt.X()` and `alt.Y()` directly on the `df`.
-- Ensure the JSON is properly escaped and do not put ```python tags inside the JSON string value.
-
-## PART 1: VISUALIZATION RULES (CRITICAL)
-You MUST follow these rules to select the best chart type:
-
-1. **CASE: Text-Only List (NO Numeric Columns)**
-   - *Condition:* Data has only names/categories (no numbers).
-   - *Action:* Use `mark_text` to list items.
-
-2. **CASE: Single Row / KPI (1 Row, Multiple Metrics)**
-   - *Condition:* Data has 1 row but multiple metrics (e.g., Sales vs Profit).
-   - *Action:* **Melt** (Unpivot) the data first, then use **Horizontal Bar Chart** with **Text Labels**.
-   - *Code Pattern:* `df.melt` -> `mark_bar` + `mark_text`.
-
-3. **CASE: Time Series (Date/Year/Month)**
-   - *Condition:* One column is Date/Year/Month.
-   - *Action:* **Line Chart** (`mark_line`).
-
-4. **CASE: Categorical Comparison (Names/Items/Groups)**
-   - *Condition:* Categories + Numbers.
-   - *Action:* **ALWAYS use Horizontal Bar Chart** (`swap x, y`) unless labels are very short (e.g. "Q1").
-   - *Reason:* Long text labels are hard to read on a vertical x-axis.
-   - *Config:* `x=Numeric:Q`, `y=Category:N` (Sort by -x).
-
-## PART 2: EXPLANATION RULES
-- Focus on the "So What?": What is the most important finding?
-- Be direct and concise (max 2 sentences).
+## RULES FOR "chart_spec"
+- A JSON object, never a string or Python code. Keep it minimal: no config, no styling.
+- DO NOT include a "data" property. The query rows are attached automatically.
+- Use field names EXACTLY as they appear in the data columns.
+- Every encoding channel needs "field" and "type" (quantitative, nominal, ordinal or temporal).
+- **Text categories (e.g. Products, Cities) ALWAYS use a HORIZONTAL bar chart. Vertical is ONLY for Time/Dates.**
+
+## VISUALIZATION CASES
+If the user message ends with a "Chart Hint", the case has already been identified for you: use it directly.
+1. Text-Only List (no numeric columns): `"mark": "text"`.
+2. Single Row / KPI (1 row, several metrics): fold the metrics into Metric/Value, layer a bar + text label.
+3. Time Series (Date/Year/Month column): `"mark": "line"`.
+4. Categorical Comparison (categories + numbers): horizontal bar, x = number, y = category sorted "-x".
+
+## EXPLANATION RULES
+- Focus on the "So What?": the most important finding, max 2 sentences.
 - Mention specific numbers/names from the top results.
-
-## OUTPUT FORMAT
-Return strictly valid JSON:
-{
-  "chart_spec": "import altair as alt...",
-  "explanation": "The analysis shows..."
-}
 </system_prompt>
 
-<instructions>
-Input Data: (Data is provided in the user message)
-
-Thinking Process:
-1. Scan Input Data.
-2. Identify the Case (1-4) for visualization.
-3. Generate Python code for 'chart_spec'.
-4. Write insight for 'explanation'.
-5. Combine into JSON.
-</instructions>
+<examples>
+  <example>
+    <input>Columns: Product_Name, Total_Sales (Case 4)</input>
+    <output>{"chart_spec": {"mark": "bar", "encoding": {"x": {"field": "Total_Sales", "type": "quantitative"}, "y": {"field": "Product_Name", "type": "nominal", "sort": "-x"}}}, "explanation": "..."}</output>
+  </example>
+
+  <example>
+    <input>Columns: Year, Revenue (Case 3)</input>
+    <output>{"chart_spec": {"mark": "line", "encoding": {"x": {"field": "Year", "type": "ordinal"}, "y": {"field": "Revenue", "type": "quantitative"}}}, "explanation": "..."}</output>
+  </example>
+
+  <example>
+    <input>Columns: Total_Sales, Total_Quota, 1 row (Case 2)</input>
+    <output>{"chart_spec": {"transform": [{"fold": ["Total_Sales", "Total_Quota"], "as": ["Metric", "Value"]}], "encoding": {"x": {"field": "Value", "type": "quantitative"}, "y": {"field": "Metric", "type": "nominal"}}, "layer": [{"mark": "bar"}, {"mark": {"type": "text", "align": "left", "dx": 5}, "encoding": {"text": {"field": "Value", "type": "quantitative"}}}]}, "explanation": "..."}</output>
+  </example>
+</examples>
     """,
+    # Short, bounded JSON answer: no thinking tokens (they would count against the cap)
+    # and JSON mode so no prose or fences are generated.
+    planner=BuiltInPlanner(thinking_config=types.ThinkingConfig(thinking_budget=0)),
+    generate_content_config=types.GenerateContentConfig(
+        max_output_tokens=1024,
+        response_mime_type="application/json",
+    ),
+    include_contents='none',
     output_key="analysis_result"
 )
 
-analysis_runner = InMemoryRunner(agent=analysis_agent, app_name='analysis')
+analysis_runner = _create_runner(analysis_agent, 'analysis')
@@ -5,13 +5,18 @@ This module provides a clean interface for database operations,
 keeping the app.py focused on UI and agent orchestration.
 """
 
+import orjson
 import pandas as pd
-import json
 from typing import Dict, Tuple, Optional
 from sqlalchemy.engine import Engine
 
-from .db_config import create_db_engine, get_schema_info, validate_connection
-from .sql_executor import execute_query
+from .db_config import create_db_engine, get_schema_info, validate_connection, clear_schema_cache
+from .sql_executor import execute_query, dataframe_to_records_json
+
+# Summary statistics for larger results are computed on a sample of this many rows,
+# and skipped entirely above STATS_MAX_ROWS
+STATS_SAMPLE_ROWS = 10_000
+STATS_MAX_ROWS = 50_000
 
 
 class BIService:
@@ -69,12 +74,13 @@ class BIService:
         except Exception as e:
             return False, f"Connection error: {str(e)}"
 
-    def load_schema(self, max_tables: int = 20) -> str:
+    def load_schema(self, max_tables: int = 20, force: bool = False) -> str:
         """
         Load database schema information.
 
         Args:
             max_tables: Maximum number of tables to include
+            force: Re-read the catalog even if a cached schema is still fresh
 
         Returns:
             Formatted schema string
@@ -82,6 +88,9 @@ class BIService:
         if self.engine is None:
             raise RuntimeError("Not connected to database. Call connect() first.")
 
+        if force:
+            clear_schema_cache(self.engine)
+
         self.schema_info = get_schema_info(self.engine, max_tables=max_tables)
         return self.schema_info
 
@@ -106,13 +115,15 @@ class BIService:
 
         return execute_query(self.engine, sql_query)
 
-    def prepare_data_for_agents(self, df: pd.DataFrame, sql_query: str = "") -> str:
+    def prepare_data_for_agents(self, df: pd.DataFrame, sql_query: str = "", include_stats: bool = True) -> str:
         """
         Prepare query results as a formatted string for agents.
 
         Args:
             df: Query results as DataFrame
             sql_query: Original SQL query (optional)
+            include_stats: Whether to append summary statistics for numeric columns
+                (always skipped for results over STATS_MAX_ROWS)
 
         Returns:
             Formatted string with data summary, sample, and statistics
@@ -120,12 +131,14 @@ class BIService:
         if df is None or df.empty:
             return "No data available"
 
-        data_summary = {
-            'columns': df.columns.tolist(),
-            'row_count': len(df),
-            'sample_data': df.head(10).to_dict(orient='records'),
-            'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}
-        }
+        # Everything except the statistics comes from the 10-row head, so the
+        # prompt costs the same for 100 or 100k rows
+        head = df.head(10)
+        row_count = len(df.index)
+        columns = [str(col) for col in head.columns]
+        dtypes_text = orjson.dumps(dict(zip(columns, map(str, head.dtypes)))).decode()
+        # pandas writes the sample straight to JSON; also handles Timestamps/Decimals
+        sample_json = dataframe_to_records_json(head, indent=2)
 
         # Build formatted prompt
         prompt = f"""Here are the query results:
@@ -135,21 +148,27 @@ class BIService:
             prompt += f"\nSQL Query: {sql_query}\n"
 
         prompt += f"""
-Results: {len(df)} rows returned
+Results: {row_count} rows returned
 
-Columns: {', '.join(data_summary['columns'])}
-Data Types: {json.dumps(data_summary['dtypes'])}
+Columns: {', '.join(columns)}
+Data Types: {dtypes_text}
 
 Sample Data (first 10 rows):
-{json.dumps(data_summary['sample_data'], indent=2)}
+{sample_json}
 """
 
         # Add summary statistics if there are numeric columns
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-        if numeric_cols:
-            prompt += f"""
+        if include_stats and row_count <= STATS_MAX_ROWS:
+            numeric_cols = head.select_dtypes(include=['number']).columns.tolist()
+            if numeric_cols:
+                stats_df = df[numeric_cols]
+                # A fixed sample is plenty for prompt context on large results
+                if len(stats_df) > STATS_SAMPLE_ROWS:
+                    stats_df = stats_df.sample(n=STATS_SAMPLE_ROWS, random_state=0)
+                # percentiles=[] keeps count/mean/std/min/50%/max without sorting for quartiles
+                prompt += f"""
 Summary Statistics:
-{df.describe().to_string()}
+{stats_df.describe(percentiles=[]).to_string()}
 """
 
         return prompt
@@ -0,0 +1,101 @@
+"""
+Question-level result cache for the BI pipeline.
+
+This module lets the app answer a repeated (or cosmetically reworded) question
+from memory, skipping both LLM calls and the database round trip.
+"""
+
+import re
+import copy
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so cosmetic differences do not cause cache misses.
+
+    Lowercases, drops punctuation and collapses whitespace, e.g.
+    "Top 10 products by price?" -> "top 10 products by price".
+
+    Args:
+        question: Raw user question
+
+    Returns:
+        Normalized question string
+    """
+    question = _NON_WORD_RE.sub(" ", question.lower())
+    return _WHITESPACE_RE.sub(" ", question).strip()
+
+
+class QuestionCache:
+    """In-memory LRU cache mapping normalized user questions to pipeline results."""
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 900):
+        """
+        Initialize the cache.
+
+        Only exact matches on the normalized question are hits: a single word
+        ("max" vs "min", "Actual" vs "Budget") changes the answer, so similar
+        questions are never treated as the same one.
+
+        Args:
+            max_entries: Maximum number of cached questions (least recently used are evicted)
+            ttl_seconds: Age after which an entry is stale, so answers follow data changes
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, Dict]]" = OrderedDict()
+
+    def get(self, question: str) -> Optional[Dict]:
+        """
+        Look up results for a question.
+
+        Args:
+            question: User question
+
+        Returns:
+            A copy of the cached results dictionary, or None on a miss or stale entry
+        """
+        key = normalize_question(question)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, results = entry
+        if time.monotonic() - stored_at >= self.ttl_seconds:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return copy.deepcopy(results)
+
+    def put(self, question: str, results: Dict) -> None:
+        """
+        Store pipeline results for a question.
+
+        Args:
+            question: User question
+            results: Results dictionary produced by the pipeline
+        """
+        key = normalize_question(question)
+        if not key:
+            return
+
+        self._entries[key] = (time.monotonic(), copy.deepcopy(results))
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
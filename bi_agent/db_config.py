@@ -5,10 +5,20 @@ This module provides utilities for connecting to Microsoft SQL Server
 and retrieving schema information for the LLM context.
 """
 
+import json
+import time
+import threading
 import urllib.parse
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import bindparam, create_engine, text
 from sqlalchemy.engine import Engine
 
+# Schema rarely changes within a session, so catalog lookups are cached for a
+# few minutes. Keys start with the database URL, followed by whatever identifies
+# the lookup (e.g. max_tables, limit_tables). Failures are never cached.
+SCHEMA_CACHE_TTL_SECONDS = 300
+_SCHEMA_CACHE: dict[tuple, tuple[float, str]] = {}
+_SCHEMA_CACHE_LOCK = threading.Lock()
+
 
 def create_db_engine(
     server: str, 
@@ -16,7 +26,8 @@ def create_db_engine(
     username: str, 
     password: str, 
     driver: str = "ODBC Driver 18 for SQL Server",
-    trust_server_certificate: bool = True
+    trust_server_certificate: bool = True,
+    **engine_kwargs
 ) -> Engine:
     """
     Create a SQLAlchemy engine for MS SQL Server connection.
@@ -28,6 +39,7 @@ def create_db_engine(
         password: Database password
         driver: ODBC driver name (default: ODBC Driver 18 for SQL Server)
         trust_server_certificate: Whether to trust server certificate (default: True)
+        **engine_kwargs: Extra options passed to create_engine (e.g. pool_size, pool_pre_ping)
 
     Returns:
         SQLAlchemy Engine object
@@ -52,7 +64,7 @@ def create_db_engine(
     connection_string = f"mssql+pyodbc:///?odbc_connect={params}"
 
     # Create engine
-    engine = create_engine(connection_string, echo=False)
+    engine = create_engine(connection_string, echo=False, **engine_kwargs)
 
     return engine
 
@@ -76,6 +88,35 @@ def validate_connection(engine: Engine) -> tuple[bool, str]:
         return False, f"Connection failed: {str(e)}"
 
 
+def get_cached_schema(cache_key: tuple) -> str | None:
+    """
+    Return a cached schema text if it is still fresh.
+
+    Args:
+        cache_key: Tuple whose first item is the database URL
+
+    Returns:
+        The cached schema text, or None on a miss or stale entry
+    """
+    with _SCHEMA_CACHE_LOCK:
+        cached = _SCHEMA_CACHE.get(cache_key)
+    if cached is not None and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+def cache_schema(cache_key: tuple, schema_text: str) -> None:
+    """
+    Store a successfully retrieved schema text.
+
+    Args:
+        cache_key: Tuple whose first item is the database URL
+        schema_text: Schema text to cache
+    """
+    with _SCHEMA_CACHE_LOCK:
+        _SCHEMA_CACHE[cache_key] = (time.monotonic(), schema_text)
+
+
 def get_schema_info(engine: Engine, limit_tables: list[str] = None, max_tables: int = 20) -> str:
     """
     Retrieve database schema information formatted for LLM context.
@@ -88,70 +129,83 @@ def get_schema_info(engine: Engine, limit_tables: list[str] = None, max_tables:
     Returns:
         Formatted string containing schema information
     """
+    cache_key = (str(engine.url), max_tables, tuple(limit_tables or ()))
+    cached = get_cached_schema(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         with engine.connect() as connection:
-            # Query to get table and column information
-            query = text("""
-                SELECT
-                    t.TABLE_SCHEMA,
-                    t.TABLE_NAME,
-                    c.COLUMN_NAME,
-                    c.DATA_TYPE,
-                    c.IS_NULLABLE,
-                    c.COLUMN_DEFAULT
+            # One row per table; SQL Server nests the columns as JSON (FOR JSON PATH)
+            # and TOP keeps the transfer to the tables we will actually show.
+            # COUNT(*) OVER() is evaluated before TOP, giving the total table count.
+            table_filter = ""
+            params = {'max_tables': max_tables}
+            if limit_tables:
+                table_filter = "AND t.TABLE_SCHEMA + '.' + t.TABLE_NAME IN :limit_tables"
+                params['limit_tables'] = list(limit_tables)
+
+            query = text(f"""
+                SELECT TOP (:max_tables)
+                    t.TABLE_SCHEMA + '.' + t.TABLE_NAME AS full_table_name,
+                    (
+                        SELECT c.COLUMN_NAME, c.DATA_TYPE, c.IS_NULLABLE
+                        FROM INFORMATION_SCHEMA.COLUMNS c
+                        WHERE c.TABLE_SCHEMA = t.TABLE_SCHEMA
+                          AND c.TABLE_NAME = t.TABLE_NAME
+                        ORDER BY c.ORDINAL_POSITION
+                        FOR JSON PATH
+                    ) AS columns_json,
+                    COUNT(*) OVER () AS total_tables
                 FROM INFORMATION_SCHEMA.TABLES t
-                INNER JOIN INFORMATION_SCHEMA.COLUMNS c
-                    ON t.TABLE_SCHEMA = c.TABLE_SCHEMA
-                    AND t.TABLE_NAME = c.TABLE_NAME
                 WHERE t.TABLE_TYPE = 'BASE TABLE'
-                ORDER BY t.TABLE_SCHEMA, t.TABLE_NAME, c.ORDINAL_POSITION
+                  AND EXISTS (
+                      SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS c
+                      WHERE c.TABLE_SCHEMA = t.TABLE_SCHEMA AND c.TABLE_NAME = t.TABLE_NAME
+                  )
+                  {table_filter}
+                ORDER BY t.TABLE_SCHEMA, t.TABLE_NAME
             """)
+            if limit_tables:
+                query = query.bindparams(bindparam('limit_tables', expanding=True))
 
-            result = connection.execute(query)
-            rows = result.fetchall()
-
-            # Organize data by table
-            tables = {}
-            for row in rows:
-                schema_name = row[0]
-                table_name = row[1]
-                full_table_name = f"{schema_name}.{table_name}"
-
-                # Skip if not in limit_tables (if specified)
-                if limit_tables and full_table_name not in limit_tables:
-                    continue
-
-                if full_table_name not in tables:
-                    tables[full_table_name] = []
-
-                column_info = {
-                    'name': row[2],
-                    'type': row[3],
-                    'nullable': row[4],
-                    'default': row[5]
-                }
-                tables[full_table_name].append(column_info)
-
-            # Limit number of tables if needed
-            table_names = list(tables.keys())[:max_tables]
+            rows = connection.execute(query, params).fetchall()
 
             # Format as readable text
             schema_text = "Database Schema:\n\n"
 
-            for table_name in table_names:
-                schema_text += f"Table: {table_name}\n"
+            for full_table_name, columns_json, _ in rows:
+                schema_text += f"Table: {full_table_name}\n"
                 schema_text += "Columns:\n"
 
-                for col in tables[table_name]:
-                    nullable = "NULL" if col['nullable'] == 'YES' else "NOT NULL"
-                    schema_text += f"  - {col['name']} ({col['type']}, {nullable})\n"
+                for col in json.loads(columns_json):
+                    nullable = "NULL" if col['IS_NULLABLE'] == 'YES' else "NOT NULL"
+                    schema_text += f"  - {col['COLUMN_NAME']} ({col['DATA_TYPE']}, {nullable})\n"
 
                 schema_text += "\n"
 
-            if len(tables) > max_tables:
-                schema_text += f"\n... and {len(tables) - max_tables} more tables\n"
+            total_tables = rows[0][2] if rows else 0
+            if total_tables > max_tables:
+                schema_text += f"\n... and {total_tables - max_tables} more tables\n"
 
+            cache_schema(cache_key, schema_text)
             return schema_text
 
     except Exception as e:
         return f"Error retrieving schema: {str(e)}"
+
+
+def clear_schema_cache(engine: Engine = None) -> None:
+    """
+    Drop cached schema lookups.
+
+    Args:
+        engine: Only drop entries for this engine's database (None = drop all)
+    """
+    with _SCHEMA_CACHE_LOCK:
+        if engine is None:
+            _SCHEMA_CACHE.clear()
+            return
+        url = str(engine.url)
+        for key in [key for key in _SCHEMA_CACHE if key[0] == url]:
+            del _SCHEMA_CACHE[key]
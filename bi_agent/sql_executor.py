@@ -18,6 +18,31 @@ BLACKLIST_KEYWORDS = [
     'sp_', 'xp_'  # System stored procedures
 ]
 
+# A row limit the query already sets itself (SELECT TOP n / ... LIMIT n)
+ROW_LIMIT_RE = re.compile(r'\bTOP\b|\bLIMIT\b', re.IGNORECASE)
+
+# Rows fetched per fetchmany() call while reading a result set
+STREAM_CHUNK_ROWS = 65536
+
+# Markdown code fences that LLMs wrap around output. A language tag is only
+# dropped on an opening fence line ("```sql" + newline) or when it is a known
+# tag ("```json{...}"); any other fence loses just the backticks, so text that
+# touches a fence ("```SELECT ...```") is kept intact.
+FENCE_RE = re.compile(r"^```[A-Za-z]*[ \t]*$|```(?:t?sql|json)(?!\w)|```", re.MULTILINE | re.IGNORECASE)
+
+
+def strip_code_fences(text: str) -> str:
+    """
+    Remove markdown code fences from LLM output in a single pass.
+
+    Args:
+        text: Raw model output (e.g. "```sql\nSELECT 1\n```")
+
+    Returns:
+        Output without fences, stripped of surrounding whitespace
+    """
+    return FENCE_RE.sub("", text).strip()
+
 
 def validate_sql(query: str) -> tuple[bool, str]:
     """
@@ -69,7 +94,7 @@ def execute_query(engine: Engine, query: str, timeout: int = 30, max_rows: int =
         engine: SQLAlchemy Engine object
         query: SQL query to execute
         timeout: Query timeout in seconds (default: 30)
-        max_rows: Maximum number of rows to return (default: 1000)
+        max_rows: Maximum number of rows to return, also enforced while fetching (default: 1000)
 
     Returns:
         Dictionary with keys:
@@ -94,9 +119,9 @@ def execute_query(engine: Engine, query: str, timeout: int = 30, max_rows: int =
         # Add row limit if not already present
         query_limited = query.strip().rstrip(';')
 
-        # Simple check if query already has TOP or LIMIT
+        # Whole-word check so names like "STOP_DATE" don't count as a TOP clause
         query_upper = query_limited.upper()
-        if 'TOP' not in query_upper and 'LIMIT' not in query_upper:
+        if not ROW_LIMIT_RE.search(query_limited):
             # For SQL Server, we need to add TOP after SELECT
             # This is a simple implementation - may need refinement for complex queries
             if query_upper.startswith('SELECT DISTINCT'):
@@ -109,8 +134,25 @@ def execute_query(engine: Engine, query: str, timeout: int = 30, max_rows: int =
             # Set query timeout (SQL Server specific)
             connection = connection.execution_options(timeout=timeout)
 
-            # Execute and fetch results
-            df = pd.read_sql(text(query_limited), connection)
+            # pyodbc has no server-side cursors, but read_sql with chunksize
+            # fetches with fetchmany(): build the DataFrame chunk by chunk and
+            # stop at max_rows, so an explicit "TOP 1000000" is never fully
+            # materialized as rows and DataFrames in memory
+            chunks = []
+            fetched = 0
+            chunk_rows = min(STREAM_CHUNK_ROWS, max_rows)
+            for chunk in pd.read_sql(text(query_limited), connection, chunksize=chunk_rows):
+                chunks.append(chunk.iloc[:max_rows - fetched])
+                fetched += len(chunks[-1])
+                if fetched >= max_rows:
+                    break
+
+            if len(chunks) == 1:
+                df = chunks[0]
+            elif chunks:
+                df = pd.concat(chunks, ignore_index=True, copy=False)
+            else:
+                df = pd.DataFrame()
 
             return {
                 'success': True,
@@ -168,6 +210,30 @@ def serialize_dataframe(df: pd.DataFrame, include_sample: bool = True, sample_ro
     return pd.Series(result).to_json()
 
 
+def dataframe_to_records_json(df: pd.DataFrame, indent: int = 0) -> str:
+    """
+    Serialize DataFrame rows to a JSON array of records.
+
+    Uses pandas' C JSON writer directly instead of building one Python dict
+    per row first; datetimes are written as ISO strings.
+
+    Args:
+        df: pandas DataFrame to serialize
+        indent: Spaces per indentation level (default: 0, compact)
+
+    Returns:
+        JSON array string (e.g. '[{"col": 1}, ...]')
+    """
+    if df is None or df.empty:
+        return "[]"
+
+    # orient='records' needs unique keys; keep the last duplicate, as to_dict() does
+    if not df.columns.is_unique:
+        df = df.loc[:, ~df.columns.duplicated(keep='last')]
+
+    return df.to_json(orient='records', date_format='iso', indent=indent)
+
+
 def dataframe_to_markdown(df: pd.DataFrame, max_rows: int = 10) -> str:
     """
     Convert DataFrame to markdown table for display.
@@ -6,16 +6,83 @@ execute queries, and process results.
 """
 
 import os
-import json
+import atexit
+import threading
+import orjson
 import pandas as pd
 from typing import Dict, Any
 from dotenv import load_dotenv
-from .db_config import create_db_engine, get_schema_info
-from .sql_executor import execute_query, validate_sql
+from sqlalchemy.engine import Engine
+from .db_config import create_db_engine, get_cached_schema, cache_schema
+from .sql_executor import execute_query, dataframe_to_records_json
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
+# One pooled engine per credential set, reused by every tool call so a call only
+# checks out an existing connection instead of paying the ODBC/TLS handshake.
+POOL_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_pre_ping': True,
+    'pool_recycle': 1800,
+}
+_ENGINE_CACHE: dict[tuple, Engine] = {}
+_ENGINE_LOCK = threading.Lock()
+
+
+# Connection settings are read once at import (after .env is loaded), not on every tool call
+_DB_CONFIG = {
+    'MSSQL_SERVER': os.getenv("MSSQL_SERVER"),
+    'MSSQL_DATABASE': os.getenv("MSSQL_DATABASE"),
+    'MSSQL_USERNAME': os.getenv("MSSQL_USERNAME"),
+    'MSSQL_PASSWORD': os.getenv("MSSQL_PASSWORD"),
+    'MSSQL_DRIVER': os.getenv("MSSQL_DRIVER", "ODBC Driver 18 for SQL Server"),
+    'TRUST_SERVER_CERTIFICATE': os.getenv("TRUST_SERVER_CERTIFICATE", "true").lower() in ("true", "yes"),
+}
+CREDENTIALS_ERROR = "Database credentials not configured in environment variables"
+
+
+def _credentials() -> tuple:
+    """
+    Return the configured connection settings as create_db_engine arguments.
+
+    Raises:
+        RuntimeError: If server, database, username or password is missing
+    """
+    credentials = tuple(_DB_CONFIG.values())
+    if not all(credentials[:4]):
+        raise RuntimeError(CREDENTIALS_ERROR)
+    return credentials
+
+
+def _get_engine() -> Engine:
+    """
+    Return the shared engine for the configured credentials.
+
+    Returns:
+        Cached SQLAlchemy Engine
+
+    Raises:
+        RuntimeError: If credentials are not configured
+    """
+    key = _credentials()
+    # Tool calls run in worker threads; build each engine only once
+    with _ENGINE_LOCK:
+        engine = _ENGINE_CACHE.get(key)
+        if engine is None:
+            engine = create_db_engine(*key, **POOL_OPTIONS)
+            _ENGINE_CACHE[key] = engine
+    return engine
+
+
+@atexit.register
+def _dispose_engines() -> None:
+    """Close pooled connections at interpreter shutdown."""
+    for engine in _ENGINE_CACHE.values():
+        engine.dispose()
+    _ENGINE_CACHE.clear()
+
 
 class DatabaseTools:
     """Tools for database operations that agents can use."""
@@ -64,9 +131,9 @@ class DatabaseTools:
         result = execute_query(self.engine, sql_query)
 
         if result['success']:
-            # Convert DataFrame to list of dicts for JSON serialization
-            df = result['data']
-            data_list = df.to_dict(orient='records') if df is not None else []
+            # pandas' C JSON writer + orjson parse is cheaper than to_dict(),
+            # and leaves only JSON-native values (ISO dates, no numpy scalars)
+            data_list = orjson.loads(dataframe_to_records_json(result['data']))
 
             return {
                 'success': True,
@@ -111,85 +178,70 @@ def execute_sql_and_format(sql_query: str) -> str:
         {"success": true, "data": [...], "row_count": 5}
     """
     try:
-        # Get database credentials from environment
-        server = os.getenv("MSSQL_SERVER")
-        database = os.getenv("MSSQL_DATABASE")
-        username = os.getenv("MSSQL_USERNAME")
-        password = os.getenv("MSSQL_PASSWORD")
-        driver = os.getenv("MSSQL_DRIVER", "ODBC Driver 18 for SQL Server")
-        trust_cert_str = os.getenv("TRUST_SERVER_CERTIFICATE", "true").lower()
-        trust_cert = trust_cert_str == "true" or trust_cert_str == "yes"
-
-        if not all([server, database, username, password]):
-            return json.dumps({
+        # Shared pooled engine for the configured credentials
+        try:
+            engine = _get_engine()
+        except RuntimeError as e:
+            return orjson.dumps({
                 'success': False,
                 'data': [],
                 'columns': [],
                 'row_count': 0,
-                'error': 'Database credentials not configured in environment variables'
-            })
-
-        # Create database engine
-        engine = create_db_engine(server, database, username, password, driver, trust_cert)
+                'error': str(e)
+            }).decode()
 
         # Execute query
         result = execute_query(engine, sql_query)
 
         if result['success']:
-            # Convert DataFrame to list of dicts for JSON serialization
-            df = result['data']
-            data_list = df.to_dict(orient='records') if df is not None and not df.empty else []
-
-            response = {
+            # Rows go straight from the DataFrame to JSON; Fragment embeds them without re-parsing
+            data_json = dataframe_to_records_json(result['data'])
+            response_json = orjson.dumps({
                 'success': True,
-                'data': data_list,
+                'data': orjson.Fragment(data_json),
                 'columns': result['columns'],
                 'row_count': result['row_count'],
                 'error': None
-            }
+            }).decode()
         else:
-            response = {
+            response_json = orjson.dumps({
                 'success': False,
                 'data': [],
                 'columns': [],
                 'row_count': 0,
                 'error': result['error']
-            }
+            }).decode()
 
-        # Close engine
-        engine.dispose()
-
-        return json.dumps(response, indent=2)
+        return response_json
 
     except Exception as e:
-        return json.dumps({
+        return orjson.dumps({
             'success': False,
             'data': [],
             'columns': [],
             'row_count': 0,
             'error': f'Tool error: {str(e)}'
-        })
+        }).decode()
 
 
 def get_database_schema() -> str:
     """
     Retrieve ONLY core database schema (Dim & Facts) and compress the text.
+
+    The result is kept in db_config's schema cache (SCHEMA_CACHE_TTL_SECONDS), so
+    db_config.clear_schema_cache also drops it. Failed lookups are not cached.
     """
     try:
-        # Get database credentials from environment
-        server = os.getenv("MSSQL_SERVER")
-        database = os.getenv("MSSQL_DATABASE")
-        username = os.getenv("MSSQL_USERNAME")
-        password = os.getenv("MSSQL_PASSWORD")
-        driver = os.getenv("MSSQL_DRIVER", "ODBC Driver 18 for SQL Server")
-        trust_cert_str = os.getenv("TRUST_SERVER_CERTIFICATE", "true").lower()
-        trust_cert = trust_cert_str == "true" or trust_cert_str == "yes"
-
-        if not all([server, database, username, password]):
-            return "Error: Database credentials not configured in environment variables"
+        # Shared pooled engine for the configured credentials
+        try:
+            engine = _get_engine()
+        except RuntimeError as e:
+            return f"Error: {e}"
 
-        # Create database engine
-        engine = create_db_engine(server, database, username, password, driver, trust_cert)
+        cache_key = (str(engine.url), 'core_tables')
+        cached = get_cached_schema(cache_key)
+        if cached is not None:
+            return cached
 
         # 🚀 1. FILTER NOISE: ดึงเฉพาะตาราง Dim และ Facts ตัดตารางซ้ำซ้อนทิ้ง
         query = """
@@ -202,9 +254,8 @@ def get_database_schema() -> str:
         ORDER BY TABLE_NAME, ORDINAL_POSITION;
         """
 
-        df_schema = pd.read_sql(query, engine)
-
-        engine.dispose()
+        with engine.connect() as connection:
+            df_schema = pd.read_sql(query, connection)
 
         if df_schema.empty:
             return "Error: Could not retrieve schema or no matching Dim/Facts tables found."
@@ -224,6 +275,7 @@ def get_database_schema() -> str:
         for t_name, cols in schema_dict.items():
             compact_schema += f"- {t_name}: " + ", ".join(cols) + "\n"
 
+        cache_schema(cache_key, compact_schema)
         return compact_schema
 
     except Exception as e:
@@ -1,17 +1,44 @@
 import asyncio
+import hashlib
 import json
 import os
+import time
+from collections import deque
+import numpy as np
 import pandas as pd
+from pandas.util import hash_pandas_object
 from dotenv import load_dotenv
 
 # Import modules (อ้างอิงตามโครงสร้างโปรเจกต์ของคุณ)
-from bi_agent.agent import text_to_sql_runner
+from bi_agent.agent import SQL_PROMPT_TEMPLATE, text_to_sql_runner
 from bi_agent.bi_service import BIService
+from bi_agent.sql_executor import strip_code_fences
 from google.genai import types
 from bi_agent.tools import get_database_schema
 
 load_dotenv(dotenv_path='bi_agent/.env')
 
+# infer_dtype kinds for object columns that hold numbers (e.g. pyodbc Decimals)
+_NUMERIC_OBJECT_KINDS = {'decimal', 'integer', 'floating', 'mixed-integer-float'}
+
+
+def _normalize_numbers(df):
+    """
+    Make numeric columns hash by value: Decimal/int/float all become float64
+    rounded to 4 places, so Decimal('10.50'), Decimal('10.5') and 10.5 match.
+    """
+    columns = {}
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if col.dtype == object and pd.api.types.infer_dtype(col, skipna=True) in _NUMERIC_OBJECT_KINDS:
+            col = pd.to_numeric(col)
+        if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            # + 0.0 turns -0.0 into 0.0, which would otherwise hash differently
+            col = col.astype('float64').round(4) + 0.0
+        columns[f"col_{i}"] = col.to_numpy()
+    return pd.DataFrame(columns, index=df.index)
+
+
 def compare_dataframes(df_gen, df_truth):
 
     try:
@@ -22,28 +49,173 @@ def compare_dataframes(df_gen, df_truth):
         if df_gen.shape != df_truth.shape:
             return False
 
-        # 2. Copy ข้อมูลออกมาเพื่อไม่ให้กระทบตัวแปรเดิม
-        dg = df_gen.copy()
-        dt = df_truth.copy()
+        # 2-4. แปลงตัวเลข (รวม Decimal จาก pyodbc) เป็น float แล้ว Rounding ป้องกันปัญหา
+        #      Float precision (เช่น 10.0000001 vs 10.0) และ Normalize ชื่อคอลัมน์
+        #      (ป้องกันปัญหาเรื่อง Alias เช่น Total_Revenue vs SUM(Revenue));
+        #      สร้าง DataFrame ใหม่อยู่แล้ว จึงไม่ต้อง .copy() ทั้งตารางก่อน
+        dg = _normalize_numbers(df_gen)
+        dt = _normalize_numbers(df_truth)
 
-        # 3. Normalize ชื่อคอลัมน์ (ป้องกันปัญหาเรื่อง Alias เช่น Total_Revenue vs SUM(Revenue))
-        dg.columns = [f"col_{i}" for i in range(len(dg.columns))]
-        dt.columns = [f"col_{i}" for i in range(len(dt.columns))]
-
-        # 4. จัดการเรื่องทศนิยม (Rounding) ป้องกันปัญหา Float precision (เช่น 10.0000001 vs 10.0)
-        dg = dg.round(4)
-        dt = dt.round(4)
-
-        # 5. Sort ข้อมูลตามทุกคอลัมน์และ Reset Index (ป้องกันปัญหาการสลับแถว)
-        dg = dg.sort_values(by=list(dg.columns)).reset_index(drop=True)
-        dt = dt.sort_values(by=list(dt.columns)).reset_index(drop=True)
+        # 5. Hash แต่ละแถวแบบ vectorized แล้วเทียบเป็น multiset (ไม่สนลำดับแถว, ไม่ต้อง sort ทั้งตาราง)
+        hashes_gen = np.sort(hash_pandas_object(dg, index=False).to_numpy())
+        hashes_truth = np.sort(hash_pandas_object(dt, index=False).to_numpy())
 
         # 6. เปรียบเทียบข้อมูลข้างใน
-        return dg.equals(dt)
+        return np.array_equal(hashes_gen, hashes_truth)
     except Exception as e:
         print(f"   ⚠️ Comparison Error: {e}")
         return False
 
+# Free-tier Gemini quota: requests per minute and cases in flight at once
+EVAL_RPM = int(os.getenv("EVAL_RPM", "10"))
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "5"))
+
+
+# Ground-truth results saved between runs: only the generated SQL hits the DB again.
+# The key is server/database/SQL, so a change in the *data* is only picked up once
+# a file is older than EVAL_GT_CACHE_TTL seconds (default 1 day; 0 disables the cache).
+GT_CACHE_DIR = ".gt_cache"
+GT_CACHE_TTL_SECONDS = float(os.getenv("EVAL_GT_CACHE_TTL", "86400"))
+
+
+def _gt_cache_path(db_service: BIService, sql: str) -> str:
+    key = f"{db_service.server}\n{db_service.database}\n{sql.strip()}"
+    return os.path.join(GT_CACHE_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest() + ".pkl")
+
+
+def execute_ground_truth(db_service: BIService, sql: str) -> dict:
+    """Run a ground-truth query, reusing the result saved by an earlier run if present."""
+    path = _gt_cache_path(db_service, sql)
+    if GT_CACHE_TTL_SECONDS <= 0:
+        return db_service.execute_sql(sql)
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < GT_CACHE_TTL_SECONDS:
+        df = pd.read_pickle(path)
+        return {'success': True, 'data': df, 'error': None, 'row_count': len(df), 'columns': df.columns.tolist()}
+
+    result = db_service.execute_sql(sql)
+    if result['success']:
+        os.makedirs(GT_CACHE_DIR, exist_ok=True)
+        # Write then rename, so a concurrent case never reads a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{id(result)}.tmp"
+        result['data'].to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+    return result
+
+
+class AsyncRateLimiter:
+    """Sliding-window limiter: at most `max_calls` acquisitions per `period` seconds."""
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while len(self._calls) >= self.max_calls:
+                wait_time = self._calls[0] + self.period - loop.time()
+                if wait_time > 0:
+                    await asyncio.sleep(wait_time)
+                self._calls.popleft()
+            self._calls.append(loop.time())
+
+
+async def generate_sql(question: str, prompt_prefix: str, limiter: AsyncRateLimiter, log: list) -> str:
+    """Ask the Text-to-SQL agent for a query, retrying with backoff on rate limits."""
+    retry_count = 0
+    max_retries = 3
+    generated_sql = ""
+
+    while retry_count < max_retries:
+        await limiter.acquire()
+        try:
+            # สร้าง Session ใหม่สำหรับแต่ละข้อ
+            session = await text_to_sql_runner.session_service.create_session(
+                user_id='test_user', app_name='text_to_sql'
+            )
+
+            enhanced_prompt = prompt_prefix + question
+            content = types.Content(role='user', parts=[types.Part(text=enhanced_prompt)])
+
+            # รัน Agent ดึงผลลัพธ์
+            events = text_to_sql_runner.run_async(user_id='test_user', session_id=session.id, new_message=content)
+
+            async for event in events:
+                if event.actions and event.actions.state_delta:
+                    generated_sql = event.actions.state_delta.get('sql_query', '')
+
+            if generated_sql:
+                break
+
+        except Exception as e:
+            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
+                retry_count += 1
+                wait_time = 10 * 2 ** retry_count
+                log.append(f"   ⚠️ Hit Rate Limit! Retrying in {wait_time}s...")
+                await asyncio.sleep(wait_time)
+            else:
+                log.append(f"   ❌ Agent Error: {e}")
+                break
+
+    return generated_sql
+
+
+async def run_case(index: int, total: int, case: dict, db_service: BIService, prompt_prefix: str,
+                   limiter: AsyncRateLimiter, semaphore: asyncio.Semaphore) -> bool:
+    """Evaluate one test case; its report is printed as one block when it finishes."""
+    log = [f"\n[{index+1}/{total}] 🔹 Question: {case['question']}"]
+    try:
+        async with semaphore:
+            return await _check_case(case, db_service, prompt_prefix, limiter, log)
+    finally:
+        print("\n".join(log), flush=True)
+
+
+async def _check_case(case: dict, db_service: BIService, prompt_prefix: str,
+                      limiter: AsyncRateLimiter, log: list) -> bool:
+    try:
+        async with asyncio.TaskGroup() as tg:
+            # Ground truth doesn't depend on the model, so fetch it while the agent is generating
+            truth_task = tg.create_task(
+                asyncio.to_thread(execute_ground_truth, db_service, case['ground_truth_sql'])
+            )
+            generated_sql = await generate_sql(case['question'], prompt_prefix, limiter, log)
+    except Exception as db_err:
+        log.append(f"   ❌ DB Check Error: {db_err}")
+        return False
+
+    if not generated_sql:
+        log.append("   ⚠️ No SQL returned or Failed after retries")
+        return False
+
+    # Clean SQL String
+    clean_sql = strip_code_fences(generated_sql)
+    log.append(f"   🤖 Generated SQL: {clean_sql}")
+
+    # 3. Check Results (The Core Logic)
+    try:
+        res_gen = await asyncio.to_thread(db_service.execute_sql, clean_sql)
+        res_truth = truth_task.result()
+
+        if res_gen['success'] and res_truth['success']:
+            # ใช้ฟังก์ชันเปรียบเทียบระดับโปรที่เราเขียนไว้
+            is_correct = compare_dataframes(res_gen['data'], res_truth['data'])
+
+            if is_correct:
+                log.append("   ✅ CORRECT")
+                return True
+            log.append("   ❌ INCORRECT (Data mismatch or Column name issue)")
+        else:
+            err_msg = res_gen.get('error') or res_truth.get('error', 'Unknown Error')
+            log.append(f"   ❌ SQL Execution Error: {err_msg}")
+
+    except Exception as db_err:
+        log.append(f"   ❌ DB Check Error: {db_err}")
+    return False
+
+
 async def evaluate():
     print("🚀 Starting Evaluation (Safety Mode: Professional Logic)...")
     
@@ -67,90 +239,56 @@ async def evaluate():
         print("❌ No evaluation_set.json found")
         return
 
-    score = 0
     total = len(test_cases)
     schema_context = get_database_schema()
+    # Built once from the app's template (the question comes last), so every case
+    # is asked with the same prompt the app sends
+    prompt_prefix = SQL_PROMPT_TEMPLATE.format(schema=schema_context, question="")
 
-    for i, case in enumerate(test_cases):
-        print(f"\n[{i+1}/{total}] 🔹 Question: {case['question']}")
-        
-        # 🛡️ Cooling down (Free Tier Safety)
-        print("   💤 Cooling down (30s)... ", end="", flush=True)
-        for _ in range(30):
-            await asyncio.sleep(1)
-            print(".", end="", flush=True)
-        print(" Go!")
-
-        retry_count = 0
-        max_retries = 3
-        generated_sql = ""
-        
-        while retry_count < max_retries:
-            try:
-                # สร้าง Session ใหม่สำหรับแต่ละข้อ
-                session = await text_to_sql_runner.session_service.create_session(
-                    user_id='test_user', app_name='text_to_sql'
-                )
-
-                enhanced_prompt = f"Here is the Database Schema:\n{schema_context}\n\nUser Question: {case['question']}"
-                content = types.Content(role='user', parts=[types.Part(text=enhanced_prompt)])
-
-                # รัน Agent ดึงผลลัพธ์
-                events = text_to_sql_runner.run_async(user_id='test_user', session_id=session.id, new_message=content)
-                
-                async for event in events:
-                    if event.actions and event.actions.state_delta:
-                        generated_sql = event.actions.state_delta.get('sql_query', '')
-                
-                if generated_sql:
-                    break 
-
-            except Exception as e:
-                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                    retry_count += 1
-                    wait_time = retry_count * 20
-                    print(f"\n   ⚠️ Hit Rate Limit! Retrying in {wait_time}s...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    print(f"   ❌ Agent Error: {e}")
-                    break
+    # 🛡️ Rate limiter แทนการ cooldown 30s ต่อข้อ (Free Tier Safety)
+    limiter = AsyncRateLimiter(EVAL_RPM)
+    semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+    print(f"   ⏱️ Up to {EVAL_CONCURRENCY} cases in parallel, {EVAL_RPM} requests/min")
 
-        if not generated_sql:
-            print("   ⚠️ No SQL returned or Failed after retries")
-            continue
+    tasks = [
+        asyncio.create_task(run_case(i, total, case, db_service, prompt_prefix, limiter, semaphore))
+        for i, case in enumerate(test_cases)
+    ]
+    interrupted = False
+    try:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    except asyncio.CancelledError:
+        # Ctrl+C: pending cases (and their rate-limit waits) are cancelled; the
+        # cases that already finished are still scored below, then we re-raise
+        interrupted = True
+        raise
+    finally:
+        # Wait for cut-off cases to print their logs so none land after the summary
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        db_service.close()
+        print_summary(tasks, interrupted)
 
-        # Clean SQL String
-        clean_sql = generated_sql.replace("```sql", "").replace("```", "").strip()
-        print(f"   🤖 Generated SQL: {clean_sql}")
-        
-        # 3. Check Results (The Core Logic)
-        try:
-            res_gen = db_service.execute_sql(clean_sql)
-            res_truth = db_service.execute_sql(case['ground_truth_sql'])
-            
-            if res_gen['success'] and res_truth['success']:
-                # ใช้ฟังก์ชันเปรียบเทียบระดับโปรที่เราเขียนไว้
-                is_correct = compare_dataframes(res_gen['data'], res_truth['data'])
-                
-                if is_correct:
-                    print("   ✅ CORRECT")
-                    score += 1
-                else:
-                    print("   ❌ INCORRECT (Data mismatch or Column name issue)")
-                    # Debug: พิมพ์ออกมาดูว่าต่างกันตรงไหน
-                    # print(f"Generated Data:\n{res_gen['data'].head(2)}")
-                    # print(f"Truth Data:\n{res_truth['data'].head(2)}")
-            else:
-                err_msg = res_gen.get('error', 'Unknown Error')
-                print(f"   ❌ SQL Execution Error: {err_msg}")
 
-        except Exception as db_err:
-             print(f"   ❌ DB Check Error: {db_err}")
+def print_summary(tasks: list[asyncio.Task], interrupted: bool):
+    """Score the finished cases; crashed cases count as wrong and are reported."""
+    finished = [(i, task) for i, task in enumerate(tasks) if not task.cancelled()]
+    total = len(finished) if interrupted else len(tasks)
+    if interrupted:
+        print(f"\n🛑 Evaluation interrupted after {total} case(s)")
+
+    score = 0
+    for i, task in finished:
+        if task.exception() is not None:
+            print(f"   ❌ Case {i+1} crashed: {task.exception()!r}")
+        elif task.result() is True:
+            score += 1
+
     # 4. Final Summary
     print("-" * 30)
-    print(f"🎯 Final Accuracy Score: {score}/{total} ({(score/total)*100:.2f}%)")
+    print(f"🎯 Final Accuracy Score: {score}/{total} ({(score/total)*100 if total else 0:.2f}%)")
     print("-" * 30)
-    db_service.close()
 
 if __name__ == "__main__":
     asyncio.run(evaluate())
\ No newline at end of file
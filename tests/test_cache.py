@@ -0,0 +1,61 @@
+"""Tests for the question-level result cache."""
+
+import pytest
+
+from bi_agent.cache import QuestionCache, normalize_question
+
+
+RESULTS = {'sql_query': 'SELECT 1', 'explanation_text': 'ok'}
+
+
+def test_normalize_question_ignores_case_punctuation_and_spacing():
+    assert normalize_question("  Top 10 products   by PRICE? ") == "top 10 products by price"
+
+
+def test_cosmetic_rewording_hits():
+    cache = QuestionCache()
+    cache.put("Top 10 products by price?", RESULTS)
+    assert cache.get("top 10 products by price") == RESULTS
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("What is the max revenue by region?", "What is the min revenue by region?"),
+    ("List products by price ascending", "List products by price descending"),
+    ("Total sales in North America", "Total sales in South America"),
+    ("Compare Actual revenue by month", "Compare Budget revenue by month"),
+    ("Top 10 customers by sales", "Top 11 customers by sales"),
+])
+def test_one_word_difference_misses(stored, asked):
+    cache = QuestionCache()
+    cache.put(stored, RESULTS)
+    assert cache.get(asked) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("bi_agent.cache.time.monotonic", lambda: now[0])
+    cache = QuestionCache(ttl_seconds=60)
+    cache.put("total sales", RESULTS)
+
+    now[0] += 59
+    assert cache.get("total sales") == RESULTS
+    now[0] += 1
+    assert cache.get("total sales") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QuestionCache(max_entries=2)
+    cache.put("a", RESULTS)
+    cache.put("b", RESULTS)
+    cache.get("a")
+    cache.put("c", RESULTS)
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULTS
+
+
+def test_returned_results_are_copies():
+    cache = QuestionCache()
+    cache.put("total sales", RESULTS)
+    cache.get("total sales")['explanation_text'] = 'changed'
+    assert cache.get("total sales") == RESULTS
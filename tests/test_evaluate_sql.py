@@ -0,0 +1,49 @@
+"""Tests for the evaluation result comparison."""
+
+from decimal import Decimal
+
+import pandas as pd
+
+from evaluate_sql import compare_dataframes
+
+
+def test_decimal_scale_does_not_matter():
+    gen = pd.DataFrame({'Revenue': [Decimal('10.50'), Decimal('3')]})
+    truth = pd.DataFrame({'Revenue': [Decimal('10.5'), Decimal('3.00')]})
+    assert compare_dataframes(gen, truth)
+
+
+def test_float_matches_decimal_of_same_value():
+    gen = pd.DataFrame({'Total': [10.5, 2.25]})
+    truth = pd.DataFrame({'Total': [Decimal('10.50'), Decimal('2.25')]})
+    assert compare_dataframes(gen, truth)
+
+
+def test_int_matches_float_of_same_value():
+    gen = pd.DataFrame({'Orders': [3, 4]})
+    truth = pd.DataFrame({'Orders': [3.0, 4.0]})
+    assert compare_dataframes(gen, truth)
+
+
+def test_rounding_absorbs_float_noise():
+    gen = pd.DataFrame({'Avg': [10.0000001]})
+    truth = pd.DataFrame({'Avg': [Decimal('10.0')]})
+    assert compare_dataframes(gen, truth)
+
+
+def test_row_order_and_column_alias_are_ignored():
+    gen = pd.DataFrame({'Region': ['North', 'South'], 'SUM(Revenue)': [1.0, 2.0]})
+    truth = pd.DataFrame({'Region': ['South', 'North'], 'Total_Revenue': [Decimal('2'), Decimal('1')]})
+    assert compare_dataframes(gen, truth)
+
+
+def test_different_values_mismatch():
+    gen = pd.DataFrame({'Region': ['North', 'South'], 'Revenue': [1.0, 2.0]})
+    truth = pd.DataFrame({'Region': ['North', 'South'], 'Revenue': [Decimal('2'), Decimal('1')]})
+    assert not compare_dataframes(gen, truth)
+
+
+def test_numeric_text_is_not_coerced():
+    gen = pd.DataFrame({'Code': ['10.50']})
+    truth = pd.DataFrame({'Code': ['10.5']})
+    assert not compare_dataframes(gen, truth)
@@ -0,0 +1,35 @@
+"""Tests for SQL execution helpers."""
+
+import pytest
+
+from bi_agent.sql_executor import strip_code_fences
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("```sql\nSELECT 1\n```", "SELECT 1"),
+    ("```SQL\nSELECT 1\n```", "SELECT 1"),
+    ("```tsql \nSELECT 1\n```", "SELECT 1"),
+    ("```\nSELECT 1\n```", "SELECT 1"),
+    ("```SELECT TOP 5 * FROM t```", "SELECT TOP 5 * FROM t"),
+    ("```sql SELECT 1```", "SELECT 1"),
+    ('```json{"a": 1}```', '{"a": 1}'),
+    ('```json\n{"a": 1}\n```', '{"a": 1}'),
+    ("```sql\nSELECT 1\n```text after", "SELECT 1\ntext after"),
+    ("SELECT 1", "SELECT 1"),
+    ("SELECT json_value FROM t", "SELECT json_value FROM t"),
+])
+def test_strip_code_fences(raw, expected):
+    assert strip_code_fences(raw) == expected
+
+
+@pytest.mark.parametrize("generated_sql", [
+    "```sql\nSELECT TOP 5 Product_Name FROM Dim_Products\n```",
+    "```\nSELECT COUNT(*) FROM Facts_Sales\n```",
+    "SELECT COUNT(*) FROM Facts_Sales",
+    "```SELECT COUNT(*) FROM Facts_Sales```",
+])
+def test_fence_stripping_matches_evaluation_baseline(generated_sql):
+    # evaluate_sql.py used to clean generated SQL with this replace chain;
+    # scores must not change for any fence style the model produces
+    baseline = generated_sql.replace("```sql", "").replace("```", "").strip()
+    assert strip_code_fences(generated_sql) == baseline
@@ -0,0 +1,61 @@
+"""Tests for the agent tools."""
+
+from contextlib import nullcontext
+
+import pandas as pd
+import pytest
+
+from bi_agent import tools
+from bi_agent.db_config import clear_schema_cache
+
+
+SCHEMA_ROWS = pd.DataFrame({
+    'TABLE_NAME': ['Dim_Products', 'Dim_Products', 'Facts_Sales'],
+    'COLUMN_NAME': ['Product_ID', 'Product_Name', 'Amount'],
+    'DATA_TYPE': ['int', 'nvarchar', 'decimal'],
+})
+
+
+class FakeEngine:
+    url = "mssql+pyodbc:///?odbc_connect=test"
+
+    def connect(self):
+        return nullcontext(None)
+
+
+@pytest.fixture
+def schema_queries(monkeypatch):
+    """Serve the schema from a fake engine and record each catalog query."""
+    queries = []
+
+    def fake_read_sql(query, connection):
+        queries.append(query)
+        return SCHEMA_ROWS
+
+    clear_schema_cache()
+    monkeypatch.setattr(tools, '_get_engine', lambda: FakeEngine())
+    monkeypatch.setattr(tools.pd, 'read_sql', fake_read_sql)
+    yield queries
+    clear_schema_cache()
+
+
+def test_get_database_schema_is_compact(schema_queries):
+    schema = tools.get_database_schema()
+    assert schema == (
+        "Database Schema (Only Core Tables):\n"
+        "- Dim_Products: Product_ID(int), Product_Name(str)\n"
+        "- Facts_Sales: Amount(decimal)\n"
+    )
+
+
+def test_get_database_schema_is_cached(schema_queries):
+    first = tools.get_database_schema()
+    assert tools.get_database_schema() == first
+    assert len(schema_queries) == 1
+
+
+def test_clear_schema_cache_forces_requery(schema_queries):
+    tools.get_database_schema()
+    clear_schema_cache(FakeEngine())
+    tools.get_database_schema()
+    assert len(schema_queries) == 2